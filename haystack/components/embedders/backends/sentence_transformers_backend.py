@@ -2,13 +2,31 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Any, Dict, List, Optional
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
 
+import numpy as np
+from tqdm import tqdm
+
+from haystack import logging
 from haystack.lazy_imports import LazyImport
 from haystack.utils.auth import Secret
 
 with LazyImport(message="Run 'pip install \"sentence-transformers>=3.0.0\"'") as sentence_transformers_import:
-    from sentence_transformers import SentenceTransformer
+    import torch
+    from sentence_transformers import SentenceTransformer, quantize_embeddings
+
+logger = logging.getLogger(__name__)
+
+# File names used by Sentence Transformers for dynamically quantized ONNX models,
+# for example "onnx/model_qint8_avx512_vnni.onnx"
+_QUANTIZED_ONNX_FILE_NAME = re.compile(r"onnx/model_qint8_(arm64|avx2|avx512|avx512_vnni)\.onnx")
+
+# Sequence lengths that batches are padded to when the model is compiled. A compiled model is specialized to the
+# shapes it has seen, so padding to a few fixed lengths lets it reuse its compiled kernels instead of recompiling.
+_PADDING_BUCKETS = (64, 128, 256, 512)
 
 
 class _SentenceTransformersEmbeddingBackendFactory:
@@ -28,8 +46,11 @@ class _SentenceTransformersEmbeddingBackendFactory:
         model_kwargs: Optional[Dict[str, Any]] = None,
         tokenizer_kwargs: Optional[Dict[str, Any]] = None,
         config_kwargs: Optional[Dict[str, Any]] = None,
+        backend: Literal["torch", "onnx", "openvino"] = "torch",
+        compile_model: bool = False,
     ):
-        embedding_backend_id = f"{model}{device}{auth_token}{truncate_dim}"
+        # Compiling changes how the backend runs the model, so compiled and uncompiled backends aren't shared
+        embedding_backend_id = f"{model}{device}{auth_token}{truncate_dim}{model_kwargs}{backend}{compile_model}"
 
         if embedding_backend_id in _SentenceTransformersEmbeddingBackendFactory._instances:
             return _SentenceTransformersEmbeddingBackendFactory._instances[embedding_backend_id]
@@ -42,6 +63,8 @@ class _SentenceTransformersEmbeddingBackendFactory:
             model_kwargs=model_kwargs,
             tokenizer_kwargs=tokenizer_kwargs,
             config_kwargs=config_kwargs,
+            backend=backend,
+            compile_model=compile_model,
         )
         _SentenceTransformersEmbeddingBackendFactory._instances[embedding_backend_id] = embedding_backend
         return embedding_backend
@@ -62,19 +85,343 @@ class _SentenceTransformersEmbeddingBackend:
         model_kwargs: Optional[Dict[str, Any]] = None,
         tokenizer_kwargs: Optional[Dict[str, Any]] = None,
         config_kwargs: Optional[Dict[str, Any]] = None,
+        backend: Literal["torch", "onnx", "openvino"] = "torch",
+        compile_model: bool = False,
     ):
         sentence_transformers_import.check()
-        self.model = SentenceTransformer(
-            model_name_or_path=model,
-            device=device,
-            use_auth_token=auth_token.resolve_value() if auth_token else None,
-            trust_remote_code=trust_remote_code,
-            truncate_dim=truncate_dim,
-            model_kwargs=model_kwargs,
-            tokenizer_kwargs=tokenizer_kwargs,
-            config_kwargs=config_kwargs,
+        load_kwargs = {
+            "device": device,
+            "use_auth_token": auth_token.resolve_value() if auth_token else None,
+            "trust_remote_code": trust_remote_code,
+            "truncate_dim": truncate_dim,
+            "tokenizer_kwargs": tokenizer_kwargs,
+            "config_kwargs": config_kwargs,
+        }
+        if backend != "torch":
+            # Only Sentence Transformers 3.2 and later accept `backend`, so we leave it out for the default
+            load_kwargs["backend"] = backend
+        if backend == "onnx":
+            self._quantize_onnx_model_if_missing(model=model, model_kwargs=model_kwargs, **load_kwargs)
+
+        self.model = SentenceTransformer(model_name_or_path=model, model_kwargs=model_kwargs, **load_kwargs)
+        self.compiled = False
+        if compile_model:
+            self.compile()
+
+    def compile(self):
+        """
+        Compiles the underlying Transformers model with `torch.compile`, which fuses its operations into fewer kernels.
+
+        Compilation happens lazily on the first batch of each shape. Afterwards, batches are padded to the batch size
+        and to the lengths in `_PADDING_BUCKETS` so that most of them reuse an already compiled model.
+        """
+        if self.compiled:
+            return
+        # Sentence Transformers 5 calls `auto_model.forward` directly instead of the module itself, which would skip
+        # a model compiled with `nn.Module.compile`. Earlier versions call the module, which in turn calls the
+        # `forward` attribute of the instance, so replacing that compiles the model for all versions.
+        # `auto_model` itself can't be replaced, since it's a read-only property in some versions.
+        auto_model = self.model[0].auto_model
+        auto_model.forward = torch.compile(auto_model.forward, mode="reduce-overhead", dynamic=False)
+        self.compiled = True
+
+    @staticmethod
+    def _quantize_onnx_model_if_missing(model: str, model_kwargs: Optional[Dict[str, Any]], **load_kwargs):
+        """
+        Creates the dynamically quantized ONNX model requested with `model_kwargs["file_name"]` if it doesn't exist yet.
+
+        Quantization only runs once: the quantized model is saved in the local model directory and loaded from
+        there afterwards. Models from the Hugging Face Hub are expected to provide the quantized file themselves.
+        """
+        file_name = (model_kwargs or {}).get("file_name")
+        match = _QUANTIZED_ONNX_FILE_NAME.fullmatch(file_name or "")
+        if not match or not os.path.isdir(model) or os.path.exists(os.path.join(model, file_name)):
+            return
+
+        try:
+            # Only needed for this optional feature, which requires a more recent Sentence Transformers version
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+        except ImportError as error:
+            raise ImportError(
+                "Quantizing ONNX models requires sentence-transformers>=3.2.0. "
+                "Run 'pip install \"sentence-transformers>=3.2.0\"'"
+            ) from error
+
+        logger.info(
+            "Quantizing ONNX model {model} to {file_name}. This only happens once.", model=model, file_name=file_name
+        )
+        onnx_model_kwargs = {key: value for key, value in model_kwargs.items() if key != "file_name"}
+        onnx_model = SentenceTransformer(model_name_or_path=model, model_kwargs=onnx_model_kwargs, **load_kwargs)
+        export_dynamic_quantized_onnx_model(onnx_model, quantization_config=match.group(1), model_name_or_path=model)
+
+    def embed(
+        self,
+        data: List[str],
+        sort_by_length: bool = False,
+        overlap_tokenization: bool = False,
+        max_tokens_per_batch: Optional[int] = None,
+        truncate_dim: Optional[int] = None,
+        precision: str = "float32",
+        convert_to_numpy: bool = False,
+        **kwargs,
+    ) -> Union[List[List[float]], np.ndarray]:
+        if not data:
+            return np.empty((0, 0), dtype=np.float32) if convert_to_numpy else []
+
+        normalize_embeddings = kwargs.get("normalize_embeddings", False)
+        if truncate_dim is not None and normalize_embeddings:
+            # Truncated embeddings must be normalized after truncation, so normalizing the full ones is wasted work
+            kwargs["normalize_embeddings"] = False
+
+        if sort_by_length and not max_tokens_per_batch and len(data) <= kwargs.get("batch_size", 32):
+            # All texts fit in one batch, which is padded to the longest text anyway, so counting tokens is wasted work
+            sort_by_length = False
+
+        # A compiled model always goes through our own batching, which pads batches to fixed lengths
+        if self.compiled or ((sort_by_length or overlap_tokenization or max_tokens_per_batch) and len(data) > 1):
+            embeddings = self._embed_in_batches(
+                data,
+                sort_by_length=sort_by_length,
+                overlap_tokenization=overlap_tokenization,
+                max_tokens_per_batch=max_tokens_per_batch,
+                **kwargs,
+            )
+        else:
+            embeddings = self.model.encode(data, **kwargs)
+
+        if truncate_dim is not None and len(embeddings) > 0:
+            embeddings = self._truncate(embeddings, truncate_dim, normalize_embeddings=normalize_embeddings)
+
+        # Quantization ranges are computed over all embeddings at once, as `encode` does,
+        # so the result doesn't depend on how the texts were split into batches
+        if precision != "float32" and len(embeddings) > 0:
+            embeddings = self.quantize(embeddings, precision=precision)
+        return embeddings if convert_to_numpy else embeddings.tolist()
+
+    @staticmethod
+    def quantize(embeddings: np.ndarray, precision: str) -> np.ndarray:
+        """
+        Quantizes float32 embeddings to the given precision, as `encode` does with its `precision` argument.
+        """
+        return quantize_embeddings(embeddings, precision=precision)
+
+    def token_lengths(self, data: List[str]) -> List[int]:
+        """
+        Returns the number of tokens of each text after truncation to the model's maximum sequence length.
+
+        Only the tokenizer runs, so this is cheap compared to a forward pass.
+        """
+        encoded = self.model.tokenizer(data, truncation=True, max_length=self.model.max_seq_length, return_length=True)
+        return encoded["length"]
+
+    def _embed_in_batches(
+        self,
+        data: List[str],
+        batch_size: int = 32,
+        show_progress_bar: Optional[bool] = None,
+        sort_by_length: bool = False,
+        overlap_tokenization: bool = False,
+        max_tokens_per_batch: Optional[int] = None,
+        **kwargs,
+    ) -> np.ndarray:
+        lengths = self.token_lengths(data) if sort_by_length or max_tokens_per_batch else None
+        # Sentence Transformers pads every batch to its longest sequence. Grouping texts of similar token length
+        # into the same batch keeps padding (and wasted attention computation) to a minimum.
+        order = np.argsort(lengths, kind="stable") if sort_by_length else np.arange(len(data))
+        if max_tokens_per_batch:
+            batch_indices = self._pack_batches(order, lengths, max_tokens_per_batch)
+        else:
+            batch_indices = [order[start : start + batch_size] for start in range(0, len(data), batch_size)]
+        batches = [[data[i] for i in indices] for indices in batch_indices]
+        progress_bar = tqdm(batches, desc="Batches", disable=not show_progress_bar)
+
+        if overlap_tokenization:
+            batch_embeddings = self._encode_with_overlapping_tokenization(progress_bar, batch_size, **kwargs)
+        elif self.compiled:
+            batch_embeddings = self._encode_with_padding_buckets(progress_bar, batch_size, **kwargs)
+        else:
+            batch_embeddings = (
+                self.model.encode(batch, batch_size=len(batch), show_progress_bar=False, **kwargs)
+                for batch in progress_bar
+            )
+
+        # Each batch is written straight to the rows of its texts in a single preallocated buffer.
+        # This restores the input order without concatenating and reordering copies of all embeddings.
+        embeddings = None
+        for indices, batch in zip(batch_indices, batch_embeddings):
+            if embeddings is None:
+                embeddings = np.empty((len(data), batch.shape[1]), dtype=batch.dtype)
+            embeddings[indices] = batch
+        return embeddings
+
+    @staticmethod
+    def _pack_batches(order: np.ndarray, lengths: List[int], max_tokens_per_batch: int) -> List[np.ndarray]:
+        """
+        Splits the texts, in the given order, into batches with at most `max_tokens_per_batch` tokens after padding.
+
+        A batch is padded to its longest text, so it holds `len(batch) * longest_length` tokens.
+        Texts longer than the limit on their own get a batch of their own.
+        """
+        batch_indices = []
+        start, longest_length = 0, 0
+        for position, i in enumerate(order):
+            longest_length = max(longest_length, lengths[i])
+            if position > start and (position - start + 1) * longest_length > max_tokens_per_batch:
+                batch_indices.append(order[start:position])
+                start, longest_length = position, lengths[i]
+        batch_indices.append(order[start:])
+        return batch_indices
+
+    def _encode_with_overlapping_tokenization(
+        self, batches: Iterable[List[str]], batch_size: Optional[int] = None, normalize_embeddings: bool = False
+    ) -> Iterator[np.ndarray]:
+        # `encode` tokenizes a batch, copies it to the device, and runs the model one step after the other,
+        # so the device idles while the CPU tokenizes. Here the next batch is tokenized in a background thread
+        # while the model runs on the current one. Fast tokenizers release the GIL, so both really run in parallel.
+        self.model.eval()
+        device = self.model.device
+        prompt = self._default_prompt()
+        # On CUDA, the background thread also copies the next batch to the device on a separate stream,
+        # so the copy runs while the model computes on the default stream
+        copy_stream = torch.cuda.Stream(device=device) if device.type == "cuda" else None
+        # A single tokenization thread is enough: fast tokenizers already split each batch across all CPU cores
+        # in Rust, without holding the GIL. Calling one tokenizer from several threads at once isn't supported and
+        # fails with "Already borrowed" errors, so tokenizing shards of a batch in a thread pool wouldn't work.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            previous_batch, previous_features = None, None
+            for batch in batches:
+                features = executor.submit(self._tokenize_and_copy, batch, device, prompt, copy_stream, batch_size)
+                if previous_features is not None:
+                    features_on_device = self._wait_for_copy(*previous_features.result(), device)
+                    yield self._forward(features_on_device, normalize_embeddings, len(previous_batch))
+                previous_batch, previous_features = batch, features
+            if previous_features is not None:
+                features_on_device = self._wait_for_copy(*previous_features.result(), device)
+                yield self._forward(features_on_device, normalize_embeddings, len(previous_batch))
+
+    def _encode_with_padding_buckets(
+        self, batches: Iterable[List[str]], batch_size: Optional[int] = None, normalize_embeddings: bool = False
+    ) -> Iterator[np.ndarray]:
+        self.model.eval()
+        device = self.model.device
+        prompt = self._default_prompt()
+        for batch in batches:
+            features = self._to_device(self._tokenize(batch, prompt, batch_size), device)
+            yield self._forward(features, normalize_embeddings, len(batch))
+
+    def _default_prompt(self) -> Optional[str]:
+        # `encode` applies the model's default prompt, so our own tokenization must apply it too
+        prompt_name = self.model.default_prompt_name
+        return self.model.prompts.get(prompt_name) if prompt_name is not None else None
+
+    def _tokenize(
+        self, texts: List[str], prompt: Optional[str] = None, batch_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        if prompt is None:
+            features = self.model.tokenize(texts)
+        elif hasattr(self.model, "preprocess"):
+            # Since Sentence Transformers 5, preprocessing adds the prompt and the prompt length used by pooling
+            features = self.model.preprocess(texts, prompt=prompt)
+        else:
+            # Earlier versions of `encode` prepend the prompt and pass its length on to pooling themselves
+            features = self.model.tokenize([prompt + text for text in texts])
+            prompt_input_ids = self.model.tokenize([prompt]).get("input_ids")
+            if prompt_input_ids is not None:
+                features["prompt_length"] = prompt_input_ids.shape[-1] - 1
+        if self.compiled:
+            self._pad_to_bucket(features, batch_size)
+        return features
+
+    def _tokenize_and_copy(
+        self,
+        texts: List[str],
+        device: "torch.device",
+        prompt: Optional[str] = None,
+        copy_stream: Optional["torch.cuda.Stream"] = None,
+        batch_size: Optional[int] = None,
+    ) -> Tuple[Dict[str, Any], Optional["torch.cuda.Event"]]:
+        features = self._tokenize(texts, prompt, batch_size)
+        if copy_stream is None:
+            return self._to_device(features, device), None
+
+        # Only copies from pinned memory run asynchronously. Pinning is a copy on the host too,
+        # but it happens here in the background thread.
+        with torch.cuda.stream(copy_stream):
+            features = self._to_device(features, device, pin_memory=True)
+            copied = torch.cuda.Event()
+            copied.record(copy_stream)
+        return features, copied
+
+    @staticmethod
+    def _wait_for_copy(
+        features: Dict[str, Any], copied: Optional["torch.cuda.Event"], device: "torch.device"
+    ) -> Dict[str, Any]:
+        if copied is not None:
+            compute_stream = torch.cuda.current_stream(device)
+            compute_stream.wait_event(copied)
+            for value in features.values():
+                if isinstance(value, torch.Tensor):
+                    # The tensors were allocated on the copy stream, so their memory must not be reused
+                    # before the model is done with them on the compute stream
+                    value.record_stream(compute_stream)
+        return features
+
+    @staticmethod
+    def _to_device(features: Dict[str, Any], device: "torch.device", pin_memory: bool = False) -> Dict[str, Any]:
+        for key, value in features.items():
+            if isinstance(value, torch.Tensor):
+                features[key] = (value.pin_memory() if pin_memory else value).to(device, non_blocking=pin_memory)
+        return features
+
+    def _pad_to_bucket(self, features: Dict[str, Any], batch_size: Optional[int] = None):
+        """
+        Pads the tokenized batch in place to `batch_size` texts and to the next length in `_PADDING_BUCKETS`.
+
+        Without padding the batch, the last, smaller batch of every call would compile the model again. Padding rows
+        repeat the first text, and their embeddings are dropped after the forward pass.
+        Longer batches are padded to a multiple of the largest bucket. Padding never exceeds the model's maximum
+        sequence length. Pooling ignores padded tokens through the attention mask, so the embeddings don't change.
+        """
+        num_texts, length = features["input_ids"].shape
+        if batch_size and batch_size > num_texts:
+            for key, value in features.items():
+                if isinstance(value, torch.Tensor) and value.dim() > 0 and value.shape[0] == num_texts:
+                    padding_rows = value[:1].expand(batch_size - num_texts, *value.shape[1:])
+                    features[key] = torch.cat([value, padding_rows])
+
+        largest_bucket = _PADDING_BUCKETS[-1]
+        padded_length = next(
+            (bucket for bucket in _PADDING_BUCKETS if bucket >= length), -(-length // largest_bucket) * largest_bucket
         )
+        if self.model.max_seq_length:
+            padded_length = max(length, min(padded_length, self.model.max_seq_length))
+        if padded_length == length:
+            return
 
-    def embed(self, data: List[str], **kwargs) -> List[List[float]]:
-        embeddings = self.model.encode(data, **kwargs).tolist()
+        tokenizer = self.model.tokenizer
+        pad = (padded_length - length, 0) if tokenizer.padding_side == "left" else (0, padded_length - length)
+        for key, value in features.items():
+            if isinstance(value, torch.Tensor) and value.dim() == 2 and value.shape[1] == length:
+                pad_value = (tokenizer.pad_token_id or 0) if key == "input_ids" else 0
+                features[key] = torch.nn.functional.pad(value, pad, value=pad_value)
+
+    def _forward(
+        self, features: Dict[str, Any], normalize_embeddings: bool = False, num_texts: Optional[int] = None
+    ) -> np.ndarray:
+        with torch.inference_mode():
+            # Embeddings of the rows added to pad the batch are dropped
+            embeddings = self.model.forward(features)["sentence_embedding"][:num_texts]
+            if normalize_embeddings:
+                embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+            return embeddings.float().cpu().numpy()
+
+    @staticmethod
+    def _truncate(embeddings: np.ndarray, truncate_dim: int, normalize_embeddings: bool = False) -> np.ndarray:
+        # For models trained with Matryoshka Representation Learning, truncation is a plain slice of the full
+        # embedding. Doing it here instead of when loading the model lets one model serve several dimensions.
+        embeddings = embeddings[:, :truncate_dim]
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            # The slice is a view on the full embeddings, which nobody else uses, so we can normalize it in place
+            np.divide(embeddings, np.maximum(norms, 1e-12), out=embeddings)
         return embeddings
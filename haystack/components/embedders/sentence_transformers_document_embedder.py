@@ -2,7 +2,13 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Any, Dict, List, Literal, Optional
+import hashlib
+import json
+import sqlite3
+from contextlib import closing
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+import numpy as np
 
 from haystack import Document, component, default_from_dict, default_to_dict
 from haystack.components.embedders.backends.sentence_transformers_backend import (
@@ -56,6 +62,15 @@ class SentenceTransformersDocumentEmbedder:
         tokenizer_kwargs: Optional[Dict[str, Any]] = None,
         config_kwargs: Optional[Dict[str, Any]] = None,
         precision: Literal["float32", "int8", "uint8", "binary", "ubinary"] = "float32",
+        deduplicate: bool = True,
+        sort_by_length: bool = False,
+        backend: Literal["torch", "onnx", "openvino"] = "torch",
+        overlap_tokenization: bool = False,
+        cache_path: Optional[str] = None,
+        skip_empty_documents: bool = True,
+        max_tokens_per_batch: Optional[int] = None,
+        compile_model: bool = False,
+        load_in_4bit: bool = False,
     ):
         """
         Creates a SentenceTransformersDocumentEmbedder component.
@@ -91,9 +106,13 @@ class SentenceTransformersDocumentEmbedder:
             The dimension to truncate sentence embeddings to. `None` does no truncation.
             If the model wasn't trained with Matryoshka Representation Learning,
             truncating embeddings can significantly affect performance.
+            Embeddings are truncated after the model computes them, so embedders that only differ in
+            `truncate_dim` share the same loaded model.
         :param model_kwargs:
             Additional keyword arguments for `AutoModelForSequenceClassification.from_pretrained`
             when loading the model. Refer to specific model documentation for available kwargs.
+            When running on a CUDA device and `torch_dtype` isn't set, the model is loaded in half precision
+            (`torch_dtype="float16"`), which roughly doubles throughput on modern GPUs.
         :param tokenizer_kwargs:
             Additional keyword arguments for `AutoTokenizer.from_pretrained` when loading the tokenizer.
             Refer to specific model documentation for available kwargs.
@@ -104,7 +123,77 @@ class SentenceTransformersDocumentEmbedder:
             All non-float32 precisions are quantized embeddings.
             Quantized embeddings are smaller and faster to compute, but may have a lower accuracy.
             They are useful for reducing the size of the embeddings of a corpus for semantic search, among other tasks.
+            "int8" and "uint8" embeddings have one 8-bit integer per dimension, which makes them 4 times smaller.
+            "binary" and "ubinary" embeddings pack 8 dimensions into each integer, which makes them 32 times smaller:
+            a model with 1024 dimensions returns embeddings with 128 values. To retrieve Documents with binary
+            embeddings, use a Document Store that compares them with the Hamming distance.
+        :param deduplicate:
+            If `True`, embeds each distinct text only once and assigns the resulting embedding
+            to all documents that share that text.
+        :param sort_by_length:
+            If `True`, sorts the texts by their number of tokens before splitting them into batches.
+            Texts in the same batch then have similar lengths, which reduces padding.
+            Sentence Transformers already sorts texts by their number of characters, and counting tokens takes an
+            extra tokenization pass, so this mainly pays off when the number of characters is a poor estimate of
+            the number of tokens, for example with texts in several languages.
+        :param backend:
+            The backend to use for the Sentence Transformers model. Choose from "torch", "onnx", or "openvino".
+            "onnx" and "openvino" can speed up inference on CPUs and require `sentence-transformers>=3.2.0`.
+            To use a dynamically quantized INT8 ONNX model, set
+            `model_kwargs={"file_name": "onnx/model_qint8_avx512_vnni.onnx"}` (or the `arm64`, `avx2`, `avx512`
+            variants). If `model` is a local directory that doesn't contain this file yet, the model is quantized
+            once when warming up and saved to that directory.
+            With "openvino", the model runs on the OpenVINO "CPU" device if `device` is a CPU and on "AUTO" otherwise,
+            which lets OpenVINO pick the best available device, such as an Intel GPU. To choose the device explicitly,
+            set `model_kwargs={"device": "GPU"}` (or "NPU", for example). To use a statically quantized INT8 model,
+            set `model_kwargs={"file_name": "openvino/openvino_model_qint8_quantized.xml"}`.
+            Refer to the [Sentence Transformers documentation](https://sbert.net/docs/sentence_transformer/usage/efficiency.html)
+            for more information on acceleration and quantization options.
+        :param overlap_tokenization:
+            If `True`, tokenizes the next batch in a background thread while the model embeds the current one.
+            This keeps GPUs busy when tokenization takes a noticeable share of the time, for example with long texts
+            or large batches.
+        :param cache_path:
+            Path to an SQLite file used to cache embeddings across runs. Texts that were already embedded with the same
+            model, `backend`, `model_kwargs`, `tokenizer_kwargs`, `config_kwargs`, `load_in_4bit`, `truncate_dim`, and
+            `normalize_embeddings` are read from the cache instead of being embedded again. `model_kwargs` includes
+            the defaults applied when loading the model, like half precision on CUDA, so a cache isn't shared between
+            embedders that load the model differently. `None` disables the cache.
+        :param skip_empty_documents:
+            If `True`, Documents with nothing to embed besides `prefix` and `suffix` aren't embedded and keep their
+            current `embedding`, which is `None` unless it was set before. These are Documents whose content is
+            missing or only whitespace, and that have no values for `meta_fields_to_embed`. Embedding them wastes
+            compute and produces meaningless embeddings. Set it to `False` if your Document Store or Retriever
+            requires every Document to have an embedding.
+        :param max_tokens_per_batch:
+            Maximum number of tokens in a batch, including padding. If set, batches are formed by token count
+            and `batch_size` is ignored: batches of short texts hold many texts and batches of long texts hold few.
+            This keeps memory usage stable and speeds up embedding of corpora with heterogeneous text lengths,
+            especially combined with `sort_by_length`.
+        :param compile_model:
+            If `True`, compiles the model with `torch.compile` when warming up, which fuses its operations into fewer
+            kernels and can speed up embedding by 10-30%, mainly on GPUs. Batches are then padded to `batch_size`
+            texts and to a few fixed lengths so the compiled model can be reused. Compiling takes some time for the
+            first batches of each length, so it pays off when embedding many Documents. The compiled model is loaded
+            separately from the model used by embedders that don't compile it. Only supported with the "torch"
+            backend, and can't be combined with `max_tokens_per_batch`, whose batches vary in size.
+        :param load_in_4bit:
+            If `True`, loads the model weights quantized to 4 bits with bitsandbytes, which makes them about 8 times
+            smaller than in float32. This lets large models, such as `intfloat/e5-mistral-7b-instruct`, fit on small
+            GPUs, with a minor loss of accuracy. Requires the `bitsandbytes` package, a CUDA device, and the "torch"
+            backend.
         """
+        if compile_model and backend != "torch":
+            raise ValueError(f"Compiling the model is only supported with the 'torch' backend, not '{backend}'.")
+        if compile_model and max_tokens_per_batch:
+            raise ValueError(
+                "Compiling the model can't be combined with `max_tokens_per_batch`, since batches of varying sizes "
+                "would compile the model again and again."
+            )
+        if load_in_4bit and backend != "torch":
+            raise ValueError(
+                f"Loading the model in 4 bits is only supported with the 'torch' backend, not '{backend}'."
+            )
 
         self.model = model
         self.device = ComponentDevice.resolve_device(device)
@@ -123,6 +212,15 @@ class SentenceTransformersDocumentEmbedder:
         self.config_kwargs = config_kwargs
         self.embedding_backend = None
         self.precision = precision
+        self.deduplicate = deduplicate
+        self.sort_by_length = sort_by_length
+        self.backend = backend
+        self.overlap_tokenization = overlap_tokenization
+        self.cache_path = cache_path
+        self.skip_empty_documents = skip_empty_documents
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.compile_model = compile_model
+        self.load_in_4bit = load_in_4bit
 
     def _get_telemetry_data(self) -> Dict[str, Any]:
         """
@@ -155,6 +253,15 @@ class SentenceTransformersDocumentEmbedder:
             tokenizer_kwargs=self.tokenizer_kwargs,
             config_kwargs=self.config_kwargs,
             precision=self.precision,
+            deduplicate=self.deduplicate,
+            sort_by_length=self.sort_by_length,
+            backend=self.backend,
+            overlap_tokenization=self.overlap_tokenization,
+            cache_path=self.cache_path,
+            skip_empty_documents=self.skip_empty_documents,
+            max_tokens_per_batch=self.max_tokens_per_batch,
+            compile_model=self.compile_model,
+            load_in_4bit=self.load_in_4bit,
         )
         if serialization_dict["init_parameters"].get("model_kwargs") is not None:
             serialize_hf_model_kwargs(serialization_dict["init_parameters"]["model_kwargs"])
@@ -183,19 +290,137 @@ class SentenceTransformersDocumentEmbedder:
         Initializes the component.
         """
         if self.embedding_backend is None:
+            device, model_kwargs = self._resolve_device_and_model_kwargs()
             self.embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(
                 model=self.model,
-                device=self.device.to_torch_str(),
+                device=device,
                 auth_token=self.token,
                 trust_remote_code=self.trust_remote_code,
-                truncate_dim=self.truncate_dim,
-                model_kwargs=self.model_kwargs,
+                truncate_dim=None,
+                model_kwargs=model_kwargs,
                 tokenizer_kwargs=self.tokenizer_kwargs,
                 config_kwargs=self.config_kwargs,
+                backend=self.backend,
+                compile_model=self.compile_model,
             )
             if self.tokenizer_kwargs and self.tokenizer_kwargs.get("model_max_length"):
                 self.embedding_backend.model.max_seq_length = self.tokenizer_kwargs["model_max_length"]
 
+    def _resolve_device_and_model_kwargs(self) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Returns the device and the model kwargs that the model is actually loaded with.
+        """
+        device = self.device.to_torch_str()
+        model_kwargs = self.model_kwargs
+        if self.load_in_4bit:
+            if not device.startswith("cuda"):
+                raise ValueError(f"Loading the model in 4 bits is only supported on CUDA devices, not on '{device}'.")
+            if "quantization_config" not in (model_kwargs or {}):
+                # Passed as a dictionary, which Transformers turns into a `BitsAndBytesConfig`
+                quantization_config = {"load_in_4bit": True, "bnb_4bit_compute_dtype": "float16"}
+                model_kwargs = {**(model_kwargs or {}), "quantization_config": quantization_config}
+        if self.backend == "torch" and device.startswith("cuda") and "torch_dtype" not in (model_kwargs or {}):
+            model_kwargs = {**(model_kwargs or {}), "torch_dtype": "float16"}
+        elif self.backend == "openvino":
+            # OpenVINO selects its own inference device and returns its outputs on the CPU,
+            # so the remaining PyTorch modules (like pooling) must run on the CPU too
+            if "device" not in (model_kwargs or {}):
+                model_kwargs = {**(model_kwargs or {}), "device": "CPU" if device == "cpu" else "AUTO"}
+            device = "cpu"
+        return device, model_kwargs
+
+    def _prepare_texts_to_embed(self, documents: List[Document]) -> List[str]:
+        """
+        Prepare the texts to embed by concatenating the Document text with the metadata fields to embed.
+        """
+        prefix, suffix = self.prefix, self.suffix
+        if not self.meta_fields_to_embed:
+            return [prefix + (doc.content or "") + suffix for doc in documents]
+
+        meta_fields_to_embed = tuple(self.meta_fields_to_embed)
+        separator = self.embedding_separator
+        texts_to_embed = [""] * len(documents)
+        for i, doc in enumerate(documents):
+            meta_values_to_embed = [str(doc.meta[key]) for key in meta_fields_to_embed if doc.meta.get(key)]
+            text_to_embed = doc.content or ""
+            if meta_values_to_embed:
+                text_to_embed = separator.join(meta_values_to_embed) + separator + text_to_embed
+            texts_to_embed[i] = prefix + text_to_embed + suffix
+        return texts_to_embed
+
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds the texts, reading already known embeddings from the cache if `cache_path` is set.
+        """
+        embed_kwargs = {
+            "batch_size": self.batch_size,
+            "show_progress_bar": self.progress_bar,
+            "normalize_embeddings": self.normalize_embeddings,
+            "sort_by_length": self.sort_by_length,
+            "overlap_tokenization": self.overlap_tokenization,
+            "max_tokens_per_batch": self.max_tokens_per_batch,
+            "truncate_dim": self.truncate_dim,
+            "convert_to_numpy": True,
+        }
+        if self.cache_path is None:
+            return self.embedding_backend.embed(texts, precision=self.precision, **embed_kwargs)
+
+        keys = self._cache_keys(texts)
+        with closing(sqlite3.connect(self.cache_path)) as connection, connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, embedding BLOB NOT NULL)")
+            cached_embeddings = self._read_cached_embeddings(connection, keys)
+            missing = [i for i, key in enumerate(keys) if key not in cached_embeddings]
+            if missing:
+                # Quantization ranges depend on all embedded texts, so we cache float32 embeddings and quantize later
+                new_embeddings = self.embedding_backend.embed(
+                    [texts[i] for i in missing], precision="float32", **embed_kwargs
+                ).astype(np.float32)
+                connection.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, embedding) VALUES (?, ?)",
+                    [(keys[i], embedding.tobytes()) for i, embedding in zip(missing, new_embeddings)],
+                )
+                cached_embeddings.update((keys[i], embedding) for i, embedding in zip(missing, new_embeddings))
+
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        embeddings = np.stack([cached_embeddings[key] for key in keys])
+        if self.precision != "float32":
+            embeddings = self.embedding_backend.quantize(embeddings, precision=self.precision)
+        return embeddings
+
+    def _cache_keys(self, texts: List[str]) -> List[bytes]:
+        # The key covers the text and all parameters that change its float32 embedding. The model kwargs are the
+        # ones the model is loaded with, so they include defaults like half precision on CUDA.
+        _, model_kwargs = self._resolve_device_and_model_kwargs()
+        # Sorted JSON gives the same key for kwargs that only differ in their order. Values that aren't JSON,
+        # like `torch.float16`, are written as strings.
+        loading_kwargs = json.dumps(
+            [model_kwargs, self.tokenizer_kwargs, self.config_kwargs], sort_keys=True, default=str
+        )
+        namespace = hashlib.blake2b(
+            f"{self.model}\0{self.backend}\0{loading_kwargs}\0{self.load_in_4bit}\0"
+            f"{self.truncate_dim}\0{self.normalize_embeddings}\0".encode(),
+            digest_size=16,
+        )
+        keys = []
+        for text in texts:
+            hasher = namespace.copy()
+            hasher.update(text.encode())
+            keys.append(hasher.digest())
+        return keys
+
+    @staticmethod
+    def _read_cached_embeddings(connection: sqlite3.Connection, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        cached_embeddings = {}
+        # SQLite limits the number of parameters in a single query
+        for start in range(0, len(keys), 500):
+            batch = keys[start : start + 500]
+            rows = connection.execute(
+                f"SELECT key, embedding FROM embeddings WHERE key IN ({', '.join('?' * len(batch))})", batch
+            )
+            cached_embeddings.update((key, np.frombuffer(embedding, dtype=np.float32)) for key, embedding in rows)
+        return cached_embeddings
+
     @component.output_types(documents=List[Document])
     def run(self, documents: List[Document]):
         """
@@ -208,33 +433,86 @@ class SentenceTransformersDocumentEmbedder:
             A dictionary with the following keys:
             - `documents`: Documents with embeddings.
         """
+        self._validate_documents(documents)
+        if self.embedding_backend is None:
+            raise RuntimeError("The embedding model has not been loaded. Please call warm_up() before running.")
+
+        return {"documents": self._embed_documents(documents)}
+
+    def run_batch(self, document_batches: List[List[Document]]) -> Dict[str, List[List[Document]]]:
+        """
+        Embed several lists of documents at once.
+
+        All Documents are embedded together, as if they were passed to a single `run` call, so batching,
+        deduplication, and sorting by length apply across the lists. This is the preferred way to embed
+        Documents that arrive in many small chunks, for example when ingesting a stream of files.
+
+        :param document_batches:
+            Lists of Documents to embed.
+
+        :returns:
+            A dictionary with the following keys:
+            - `documents`: The lists of Documents with embeddings, in the same order as `document_batches`.
+        """
+        if not isinstance(document_batches, list):
+            raise TypeError("SentenceTransformersDocumentEmbedder.run_batch expects a list of lists of Documents.")
+        for documents in document_batches:
+            self._validate_documents(documents)
+        if self.embedding_backend is None:
+            raise RuntimeError("The embedding model has not been loaded. Please call warm_up() before running.")
+
+        # Documents are embedded in place, so the input lists already hold the embedded Documents afterwards
+        self._embed_documents([doc for documents in document_batches for doc in documents])
+        return {"documents": document_batches}
+
+    @staticmethod
+    def _validate_documents(documents: List[Document]):
         if not isinstance(documents, list) or documents and not isinstance(documents[0], Document):
             raise TypeError(
                 "SentenceTransformersDocumentEmbedder expects a list of Documents as input."
                 "In case you want to embed a list of strings, please use the SentenceTransformersTextEmbedder."
             )
-        if self.embedding_backend is None:
-            raise RuntimeError("The embedding model has not been loaded. Please call warm_up() before running.")
 
-        texts_to_embed = []
-        for doc in documents:
-            meta_values_to_embed = [
-                str(doc.meta[key]) for key in self.meta_fields_to_embed if key in doc.meta and doc.meta[key]
-            ]
-            text_to_embed = (
-                self.prefix + self.embedding_separator.join(meta_values_to_embed + [doc.content or ""]) + self.suffix
-            )
-            texts_to_embed.append(text_to_embed)
+    def _embed_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        Embeds the documents in place, without validating the input.
+        """
+        texts_to_embed = self._prepare_texts_to_embed(documents=documents)
+        documents_to_embed = documents
+        if self.skip_empty_documents:
+            documents_to_embed, texts_to_embed = self._skip_empty_documents(documents, texts_to_embed)
 
-        embeddings = self.embedding_backend.embed(
-            texts_to_embed,
-            batch_size=self.batch_size,
-            show_progress_bar=self.progress_bar,
-            normalize_embeddings=self.normalize_embeddings,
-            precision=self.precision,
-        )
+        # Documents with identical texts get identical embeddings, so we only run the model on distinct texts.
+        # A single pass collects the distinct texts and the position of each document's text among them.
+        unique_texts, text_indices = texts_to_embed, None
+        if self.deduplicate:
+            index_by_text: Dict[str, int] = {}
+            text_indices = [index_by_text.setdefault(text, len(index_by_text)) for text in texts_to_embed]
+            unique_texts = list(index_by_text)
+
+        embeddings = self._embed_texts(unique_texts)
+
+        if text_indices is not None and len(unique_texts) < len(texts_to_embed):
+            embeddings = embeddings[text_indices]
 
-        for doc, emb in zip(documents, embeddings):
+        # A single conversion of the whole matrix is much cheaper than converting each row separately
+        for doc, emb in zip(documents_to_embed, embeddings.tolist()):
             doc.embedding = emb
 
-        return {"documents": documents}
+        return documents
+
+    def _skip_empty_documents(
+        self, documents: List[Document], texts_to_embed: List[str]
+    ) -> Tuple[List[Document], List[str]]:
+        """
+        Leaves out Documents with nothing to embed but the prefix and suffix, without changing their embedding.
+
+        :returns:
+            The remaining Documents and their texts to embed.
+        """
+        start, end = len(self.prefix), len(self.suffix)
+        non_empty = [i for i, text in enumerate(texts_to_embed) if text[start : len(text) - end].strip()]
+
+        if len(non_empty) == len(documents):
+            return documents, texts_to_embed
+        return [documents[i] for i in non_empty], [texts_to_embed[i] for i in non_empty]
@@ -84,6 +84,8 @@ class SentenceTransformersTextEmbedder:
         :param model_kwargs:
             Additional keyword arguments for `AutoModelForSequenceClassification.from_pretrained`
             when loading the model. Refer to specific model documentation for available kwargs.
+            When running on a CUDA device and `torch_dtype` isn't set, the model is loaded in half precision
+            (`torch_dtype="float16"`), like in `SentenceTransformersDocumentEmbedder`.
         :param tokenizer_kwargs:
             Additional keyword arguments for `AutoTokenizer.from_pretrained` when loading the tokenizer.
             Refer to specific model documentation for available kwargs.
@@ -169,13 +171,19 @@ class SentenceTransformersTextEmbedder:
         Initializes the component.
         """
         if self.embedding_backend is None:
+            device = self.device.to_torch_str()
+            model_kwargs = self.model_kwargs
+            if device.startswith("cuda") and "torch_dtype" not in (model_kwargs or {}):
+                # Same default as SentenceTransformersDocumentEmbedder, so that both embedders share the loaded model
+                # and embed queries and documents with the same precision
+                model_kwargs = {**(model_kwargs or {}), "torch_dtype": "float16"}
             self.embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(
                 model=self.model,
-                device=self.device.to_torch_str(),
+                device=device,
                 auth_token=self.token,
                 trust_remote_code=self.trust_remote_code,
                 truncate_dim=self.truncate_dim,
-                model_kwargs=self.model_kwargs,
+                model_kwargs=model_kwargs,
                 tokenizer_kwargs=self.tokenizer_kwargs,
                 config_kwargs=self.config_kwargs,
             )
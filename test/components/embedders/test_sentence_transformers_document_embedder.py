@@ -3,7 +3,7 @@
 # SPDX-License-Identifier: Apache-2.0
 from unittest.mock import MagicMock, patch
 
-import random
+import numpy as np
 import pytest
 import torch
 
@@ -28,6 +28,15 @@ class TestSentenceTransformersDocumentEmbedder:
         assert embedder.trust_remote_code is False
         assert embedder.truncate_dim is None
         assert embedder.precision == "float32"
+        assert embedder.deduplicate is True
+        assert embedder.sort_by_length is False
+        assert embedder.backend == "torch"
+        assert embedder.overlap_tokenization is False
+        assert embedder.cache_path is None
+        assert embedder.skip_empty_documents is True
+        assert embedder.max_tokens_per_batch is None
+        assert embedder.compile_model is False
+        assert embedder.load_in_4bit is False
 
     def test_init_with_parameters(self):
         embedder = SentenceTransformersDocumentEmbedder(
@@ -44,6 +53,15 @@ class TestSentenceTransformersDocumentEmbedder:
             trust_remote_code=True,
             truncate_dim=256,
             precision="int8",
+            deduplicate=False,
+            sort_by_length=True,
+            backend="onnx",
+            overlap_tokenization=True,
+            cache_path="embeddings.sqlite",
+            skip_empty_documents=False,
+            max_tokens_per_batch=8192,
+            compile_model=False,
+            load_in_4bit=False,
         )
         assert embedder.model == "model"
         assert embedder.device == ComponentDevice.from_str("cuda:0")
@@ -58,6 +76,15 @@ class TestSentenceTransformersDocumentEmbedder:
         assert embedder.trust_remote_code
         assert embedder.truncate_dim == 256
         assert embedder.precision == "int8"
+        assert embedder.deduplicate is False
+        assert embedder.sort_by_length is True
+        assert embedder.backend == "onnx"
+        assert embedder.overlap_tokenization is True
+        assert embedder.cache_path == "embeddings.sqlite"
+        assert embedder.skip_empty_documents is False
+        assert embedder.max_tokens_per_batch == 8192
+        assert embedder.compile_model is False
+        assert embedder.load_in_4bit is False
 
     def test_to_dict(self):
         component = SentenceTransformersDocumentEmbedder(model="model", device=ComponentDevice.from_str("cpu"))
@@ -81,6 +108,15 @@ class TestSentenceTransformersDocumentEmbedder:
                 "tokenizer_kwargs": None,
                 "config_kwargs": None,
                 "precision": "float32",
+                "deduplicate": True,
+                "sort_by_length": False,
+                "backend": "torch",
+                "overlap_tokenization": False,
+                "cache_path": None,
+                "skip_empty_documents": True,
+                "max_tokens_per_batch": None,
+                "compile_model": False,
+                "load_in_4bit": False,
             },
         }
 
@@ -102,6 +138,15 @@ class TestSentenceTransformersDocumentEmbedder:
             tokenizer_kwargs={"model_max_length": 512},
             config_kwargs={"use_memory_efficient_attention": True},
             precision="int8",
+            deduplicate=False,
+            sort_by_length=True,
+            backend="onnx",
+            overlap_tokenization=True,
+            cache_path="embeddings.sqlite",
+            skip_empty_documents=False,
+            max_tokens_per_batch=8192,
+            compile_model=False,
+            load_in_4bit=False,
         )
         data = component.to_dict()
 
@@ -124,6 +169,15 @@ class TestSentenceTransformersDocumentEmbedder:
                 "tokenizer_kwargs": {"model_max_length": 512},
                 "config_kwargs": {"use_memory_efficient_attention": True},
                 "precision": "int8",
+                "deduplicate": False,
+                "sort_by_length": True,
+                "backend": "onnx",
+                "overlap_tokenization": True,
+                "cache_path": "embeddings.sqlite",
+                "skip_empty_documents": False,
+                "max_tokens_per_batch": 8192,
+                "compile_model": False,
+                "load_in_4bit": False,
             },
         }
 
@@ -145,6 +199,15 @@ class TestSentenceTransformersDocumentEmbedder:
             "tokenizer_kwargs": {"model_max_length": 512},
             "config_kwargs": {"use_memory_efficient_attention": True},
             "precision": "int8",
+            "deduplicate": False,
+            "sort_by_length": True,
+            "backend": "onnx",
+            "overlap_tokenization": True,
+            "cache_path": "embeddings.sqlite",
+            "skip_empty_documents": False,
+            "max_tokens_per_batch": 8192,
+            "compile_model": False,
+            "load_in_4bit": False,
         }
         component = SentenceTransformersDocumentEmbedder.from_dict(
             {
@@ -168,6 +231,15 @@ class TestSentenceTransformersDocumentEmbedder:
         assert component.tokenizer_kwargs == {"model_max_length": 512}
         assert component.config_kwargs == {"use_memory_efficient_attention": True}
         assert component.precision == "int8"
+        assert component.deduplicate is False
+        assert component.sort_by_length is True
+        assert component.backend == "onnx"
+        assert component.overlap_tokenization is True
+        assert component.cache_path == "embeddings.sqlite"
+        assert component.skip_empty_documents is False
+        assert component.max_tokens_per_batch == 8192
+        assert component.compile_model is False
+        assert component.load_in_4bit is False
 
     def test_from_dict_no_default_parameters(self):
         component = SentenceTransformersDocumentEmbedder.from_dict(
@@ -189,6 +261,15 @@ class TestSentenceTransformersDocumentEmbedder:
         assert component.meta_fields_to_embed == []
         assert component.truncate_dim is None
         assert component.precision == "float32"
+        assert component.deduplicate is True
+        assert component.sort_by_length is False
+        assert component.backend == "torch"
+        assert component.overlap_tokenization is False
+        assert component.cache_path is None
+        assert component.skip_empty_documents is True
+        assert component.max_tokens_per_batch is None
+        assert component.compile_model is False
+        assert component.load_in_4bit is False
 
     def test_from_dict_none_device(self):
         init_parameters = {
@@ -249,8 +330,131 @@ class TestSentenceTransformersDocumentEmbedder:
             model_kwargs=None,
             tokenizer_kwargs={"model_max_length": 512},
             config_kwargs={"use_memory_efficient_attention": True},
+            backend="torch",
+            compile_model=False,
         )
 
+    @patch(
+        "haystack.components.embedders.sentence_transformers_document_embedder._SentenceTransformersEmbeddingBackendFactory"
+    )
+    def test_warmup_uses_half_precision_on_cuda(self, mocked_factory):
+        embedder = SentenceTransformersDocumentEmbedder(model="model", device=ComponentDevice.from_str("cuda:0"))
+        embedder.warm_up()
+        assert mocked_factory.get_embedding_backend.call_args.kwargs["model_kwargs"] == {"torch_dtype": "float16"}
+        assert embedder.model_kwargs is None
+
+    @patch(
+        "haystack.components.embedders.sentence_transformers_document_embedder._SentenceTransformersEmbeddingBackendFactory"
+    )
+    def test_warmup_keeps_user_dtype_on_cuda(self, mocked_factory):
+        embedder = SentenceTransformersDocumentEmbedder(
+            model="model",
+            device=ComponentDevice.from_str("cuda:0"),
+            model_kwargs={"torch_dtype": torch.float32, "attn_implementation": "sdpa"},
+        )
+        embedder.warm_up()
+        assert mocked_factory.get_embedding_backend.call_args.kwargs["model_kwargs"] == {
+            "torch_dtype": torch.float32,
+            "attn_implementation": "sdpa",
+        }
+
+    @patch(
+        "haystack.components.embedders.sentence_transformers_document_embedder._SentenceTransformersEmbeddingBackendFactory"
+    )
+    def test_warmup_load_in_4bit(self, mocked_factory):
+        embedder = SentenceTransformersDocumentEmbedder(
+            model="model", device=ComponentDevice.from_str("cuda:0"), load_in_4bit=True
+        )
+        embedder.warm_up()
+        assert mocked_factory.get_embedding_backend.call_args.kwargs["model_kwargs"] == {
+            "quantization_config": {"load_in_4bit": True, "bnb_4bit_compute_dtype": "float16"},
+            "torch_dtype": "float16",
+        }
+        assert embedder.model_kwargs is None
+        assert embedder.to_dict()["init_parameters"]["load_in_4bit"] is True
+
+    @patch(
+        "haystack.components.embedders.sentence_transformers_document_embedder._SentenceTransformersEmbeddingBackendFactory"
+    )
+    def test_warmup_load_in_4bit_requires_cuda(self, mocked_factory):
+        embedder = SentenceTransformersDocumentEmbedder(
+            model="model", device=ComponentDevice.from_str("cpu"), load_in_4bit=True
+        )
+        with pytest.raises(ValueError, match="CUDA"):
+            embedder.warm_up()
+        mocked_factory.get_embedding_backend.assert_not_called()
+
+    def test_init_load_in_4bit_requires_torch_backend(self):
+        with pytest.raises(ValueError, match="torch"):
+            SentenceTransformersDocumentEmbedder(model="model", backend="openvino", load_in_4bit=True)
+
+    @patch(
+        "haystack.components.embedders.sentence_transformers_document_embedder._SentenceTransformersEmbeddingBackendFactory"
+    )
+    def test_warmup_onnx_backend(self, mocked_factory):
+        embedder = SentenceTransformersDocumentEmbedder(
+            model="model",
+            device=ComponentDevice.from_str("cuda:0"),
+            backend="onnx",
+            model_kwargs={"file_name": "onnx/model_qint8_avx512_vnni.onnx"},
+        )
+        embedder.warm_up()
+        call_kwargs = mocked_factory.get_embedding_backend.call_args.kwargs
+        assert call_kwargs["backend"] == "onnx"
+        assert call_kwargs["model_kwargs"] == {"file_name": "onnx/model_qint8_avx512_vnni.onnx"}
+
+    @pytest.mark.parametrize(
+        "device, model_kwargs, expected_model_kwargs",
+        [
+            ("cpu", None, {"device": "CPU"}),
+            ("cuda:0", None, {"device": "AUTO"}),
+            (
+                "cpu",
+                {"device": "NPU", "file_name": "openvino/openvino_model_qint8_quantized.xml"},
+                {"device": "NPU", "file_name": "openvino/openvino_model_qint8_quantized.xml"},
+            ),
+        ],
+    )
+    @patch(
+        "haystack.components.embedders.sentence_transformers_document_embedder._SentenceTransformersEmbeddingBackendFactory"
+    )
+    def test_warmup_openvino_backend(self, mocked_factory, device, model_kwargs, expected_model_kwargs):
+        embedder = SentenceTransformersDocumentEmbedder(
+            model="model", device=ComponentDevice.from_str(device), backend="openvino", model_kwargs=model_kwargs
+        )
+        embedder.warm_up()
+        call_kwargs = mocked_factory.get_embedding_backend.call_args.kwargs
+        assert call_kwargs["backend"] == "openvino"
+        assert call_kwargs["device"] == "cpu"
+        assert call_kwargs["model_kwargs"] == expected_model_kwargs
+
+    @patch(
+        "haystack.components.embedders.sentence_transformers_document_embedder._SentenceTransformersEmbeddingBackendFactory"
+    )
+    def test_warmup_compiles_model(self, mocked_factory):
+        embedder = SentenceTransformersDocumentEmbedder(model="model", compile_model=True)
+        embedder.warm_up()
+        assert mocked_factory.get_embedding_backend.call_args.kwargs["compile_model"] is True
+
+    def test_init_compile_model_requires_torch_backend(self):
+        with pytest.raises(ValueError, match="torch"):
+            SentenceTransformersDocumentEmbedder(model="model", backend="onnx", compile_model=True)
+
+    def test_init_compile_model_rejects_max_tokens_per_batch(self):
+        with pytest.raises(ValueError, match="max_tokens_per_batch"):
+            SentenceTransformersDocumentEmbedder(model="model", compile_model=True, max_tokens_per_batch=1024)
+
+    @patch(
+        "haystack.components.embedders.sentence_transformers_document_embedder._SentenceTransformersEmbeddingBackendFactory"
+    )
+    def test_warmup_loads_model_without_truncation(self, mocked_factory):
+        embedder = SentenceTransformersDocumentEmbedder(model="model", truncate_dim=256)
+        embedder.warm_up()
+        assert mocked_factory.get_embedding_backend.call_args.kwargs["truncate_dim"] is None
+
+        embedder.run(documents=[Document(content="document")])
+        assert embedder.embedding_backend.embed.call_args.kwargs["truncate_dim"] == 256
+
     @patch(
         "haystack.components.embedders.sentence_transformers_document_embedder._SentenceTransformersEmbeddingBackendFactory"
     )
@@ -264,9 +468,7 @@ class TestSentenceTransformersDocumentEmbedder:
     def test_run(self):
         embedder = SentenceTransformersDocumentEmbedder(model="model")
         embedder.embedding_backend = MagicMock()
-        embedder.embedding_backend.embed = lambda x, **kwargs: [
-            [random.random() for _ in range(16)] for _ in range(len(x))
-        ]
+        embedder.embedding_backend.embed = lambda x, **kwargs: np.random.rand(len(x), 16)
 
         documents = [Document(content=f"document number {i}") for i in range(5)]
 
@@ -279,6 +481,188 @@ class TestSentenceTransformersDocumentEmbedder:
             assert isinstance(doc.embedding, list)
             assert isinstance(doc.embedding[0], float)
 
+    def test_run_deduplicates_texts(self):
+        embedder = SentenceTransformersDocumentEmbedder(model="model")
+        embedder.embedding_backend = MagicMock()
+        embedder.embedding_backend.embed = MagicMock(
+            side_effect=lambda x, **kwargs: np.array([[float(i)] * 4 for i in range(len(x))])
+        )
+
+        documents = [Document(content=text) for text in ["a", "b", "a", "c", "b"]]
+        result = embedder.run(documents=documents)
+
+        assert embedder.embedding_backend.embed.call_args[0][0] == ["a", "b", "c"]
+        embeddings = [doc.embedding for doc in result["documents"]]
+        assert embeddings == [[0.0] * 4, [1.0] * 4, [0.0] * 4, [2.0] * 4, [1.0] * 4]
+        assert embeddings[0] is not embeddings[2]
+
+    def test_run_batch(self):
+        embedder = SentenceTransformersDocumentEmbedder(model="model")
+        embedder.embedding_backend = MagicMock()
+        embedder.embedding_backend.embed = MagicMock(
+            side_effect=lambda x, **kwargs: np.array([[float(len(text))] * 4 for text in x])
+        )
+
+        document_batches = [[Document(content="a"), Document(content="bb")], [], [Document(content="ccc")]]
+        result = embedder.run_batch(document_batches=document_batches)
+
+        embedder.embedding_backend.embed.assert_called_once()
+        assert embedder.embedding_backend.embed.call_args[0][0] == ["a", "bb", "ccc"]
+        assert [[doc.embedding for doc in documents] for documents in result["documents"]] == [
+            [[1.0] * 4, [2.0] * 4],
+            [],
+            [[3.0] * 4],
+        ]
+
+    def test_run_batch_wrong_input_format(self):
+        embedder = SentenceTransformersDocumentEmbedder(model="model")
+        embedder.embedding_backend = MagicMock()
+
+        with pytest.raises(TypeError, match="list of lists of Documents"):
+            embedder.run_batch(document_batches=Document(content="a"))
+        with pytest.raises(
+            TypeError, match="SentenceTransformersDocumentEmbedder expects a list of Documents as input"
+        ):
+            embedder.run_batch(document_batches=[["text"]])
+        embedder.embedding_backend.embed.assert_not_called()
+
+    def test_run_without_deduplication(self):
+        embedder = SentenceTransformersDocumentEmbedder(model="model", deduplicate=False)
+        embedder.embedding_backend = MagicMock()
+        embedder.embedding_backend.embed = MagicMock(
+            side_effect=lambda x, **kwargs: np.array([[float(i)] * 4 for i in range(len(x))])
+        )
+
+        documents = [Document(content=text) for text in ["a", "b", "a"]]
+        result = embedder.run(documents=documents)
+
+        assert embedder.embedding_backend.embed.call_args[0][0] == ["a", "b", "a"]
+        assert [doc.embedding for doc in result["documents"]] == [[0.0] * 4, [1.0] * 4, [2.0] * 4]
+
+    def test_run_with_cache(self, tmp_path):
+        cache_path = str(tmp_path / "embeddings.sqlite")
+        embedder = SentenceTransformersDocumentEmbedder(model="model", cache_path=cache_path)
+        embedder.embedding_backend = MagicMock()
+        embedder.embedding_backend.embed = MagicMock(
+            side_effect=lambda x, **kwargs: np.array([[float(len(text))] * 4 for text in x])
+        )
+
+        result = embedder.run(documents=[Document(content="a"), Document(content="bb")])
+        assert [doc.embedding for doc in result["documents"]] == [[1.0] * 4, [2.0] * 4]
+        assert embedder.embedding_backend.embed.call_args[0][0] == ["a", "bb"]
+        assert embedder.embedding_backend.embed.call_args.kwargs["precision"] == "float32"
+
+        embedder.embedding_backend.embed.reset_mock()
+        result = embedder.run(documents=[Document(content="bb"), Document(content="ccc"), Document(content="a")])
+        assert [doc.embedding for doc in result["documents"]] == [[2.0] * 4, [3.0] * 4, [1.0] * 4]
+        assert embedder.embedding_backend.embed.call_args[0][0] == ["ccc"]
+
+        embedder.embedding_backend.embed.reset_mock()
+        embedder.run(documents=[Document(content="a"), Document(content="ccc")])
+        embedder.embedding_backend.embed.assert_not_called()
+
+    def test_run_with_cache_depends_on_embedding_parameters(self, tmp_path):
+        cache_path = str(tmp_path / "embeddings.sqlite")
+        embedder = SentenceTransformersDocumentEmbedder(model="model", cache_path=cache_path)
+        truncating_embedder = SentenceTransformersDocumentEmbedder(model="model", cache_path=cache_path, truncate_dim=2)
+        onnx_embedder = SentenceTransformersDocumentEmbedder(
+            model="model",
+            cache_path=cache_path,
+            backend="onnx",
+            model_kwargs={"file_name": "onnx/model_qint8_avx512_vnni.onnx"},
+        )
+        # On CUDA, the model is loaded in half precision by default
+        cuda_embedder = SentenceTransformersDocumentEmbedder(
+            model="model", cache_path=cache_path, device=ComponentDevice.from_str("cuda:0")
+        )
+        four_bit_embedder = SentenceTransformersDocumentEmbedder(
+            model="model", cache_path=cache_path, device=ComponentDevice.from_str("cuda:0"), load_in_4bit=True
+        )
+        short_embedder = SentenceTransformersDocumentEmbedder(
+            model="model", cache_path=cache_path, tokenizer_kwargs={"model_max_length": 8}
+        )
+        configured_embedder = SentenceTransformersDocumentEmbedder(
+            model="model", cache_path=cache_path, config_kwargs={"hidden_dropout_prob": 0.2}
+        )
+        for component in (
+            embedder,
+            truncating_embedder,
+            onnx_embedder,
+            cuda_embedder,
+            four_bit_embedder,
+            short_embedder,
+            configured_embedder,
+        ):
+            component.embedding_backend = MagicMock()
+            component.embedding_backend.embed = MagicMock(side_effect=lambda x, **kwargs: np.ones((len(x), 2)))
+            component.run(documents=[Document(content="a")])
+            component.embedding_backend.embed.assert_called_once()
+
+    def test_cache_keys_ignore_kwargs_order(self, tmp_path):
+        cache_path = str(tmp_path / "embeddings.sqlite")
+        embedder = SentenceTransformersDocumentEmbedder(
+            model="model", cache_path=cache_path, model_kwargs={"attn_implementation": "sdpa", "torch_dtype": "auto"}
+        )
+        reordered_embedder = SentenceTransformersDocumentEmbedder(
+            model="model", cache_path=cache_path, model_kwargs={"torch_dtype": "auto", "attn_implementation": "sdpa"}
+        )
+        assert embedder._cache_keys(["a"]) == reordered_embedder._cache_keys(["a"])
+
+    def test_run_with_cache_quantizes_all_embeddings(self, tmp_path):
+        cache_path = str(tmp_path / "embeddings.sqlite")
+        embedder = SentenceTransformersDocumentEmbedder(model="model", cache_path=cache_path, precision="binary")
+        embedder.embedding_backend = MagicMock()
+        embedder.embedding_backend.embed = MagicMock(side_effect=lambda x, **kwargs: np.ones((len(x), 8)))
+        embedder.embedding_backend.quantize = MagicMock(side_effect=lambda x, precision: x[:, :1].astype(np.int8))
+
+        embedder.run(documents=[Document(content="a")])
+        result = embedder.run(documents=[Document(content="a"), Document(content="b")])
+
+        assert [doc.embedding for doc in result["documents"]] == [[1], [1]]
+        assert embedder.embedding_backend.quantize.call_args.args[0].shape == (2, 8)
+        assert embedder.embedding_backend.quantize.call_args.kwargs == {"precision": "binary"}
+
+    def test_run_with_binary_precision(self):
+        embedder = SentenceTransformersDocumentEmbedder(model="model", precision="ubinary")
+        embedder.embedding_backend = MagicMock()
+        embedder.embedding_backend.embed = MagicMock(
+            side_effect=lambda x, **kwargs: np.full((len(x), 1024 // 8), 255, dtype=np.uint8)
+        )
+
+        result = embedder.run(documents=[Document(content="document")])
+
+        assert embedder.embedding_backend.embed.call_args.kwargs["precision"] == "ubinary"
+        assert result["documents"][0].embedding == [255] * 128
+
+    def test_run_skips_empty_documents(self):
+        embedder = SentenceTransformersDocumentEmbedder(
+            model="model", prefix="query: ", suffix=" end", meta_fields_to_embed=["title"]
+        )
+        embedder.embedding_backend = MagicMock()
+        embedder.embedding_backend.embed = MagicMock(side_effect=lambda x, **kwargs: np.ones((len(x), 2)))
+
+        documents = [
+            Document(content="text"),
+            Document(content=None, embedding=[0.5, 0.5]),
+            Document(content=" \n"),
+            Document(content="", meta={"title": "title"}),
+        ]
+        result = embedder.run(documents=documents)
+
+        assert embedder.embedding_backend.embed.call_args[0][0] == ["query: text end", "query: title\n end"]
+        # An embedding set before is left untouched
+        assert [doc.embedding for doc in result["documents"]] == [[1.0, 1.0], [0.5, 0.5], None, [1.0, 1.0]]
+
+    def test_run_embeds_empty_documents(self):
+        embedder = SentenceTransformersDocumentEmbedder(model="model", prefix="query: ", skip_empty_documents=False)
+        embedder.embedding_backend = MagicMock()
+        embedder.embedding_backend.embed = MagicMock(side_effect=lambda x, **kwargs: np.ones((len(x), 2)))
+
+        result = embedder.run(documents=[Document(content="text"), Document(content=None)])
+
+        assert embedder.embedding_backend.embed.call_args[0][0] == ["query: text", "query: "]
+        assert [doc.embedding for doc in result["documents"]] == [[1.0, 1.0], [1.0, 1.0]]
+
     def test_run_wrong_input_format(self):
         embedder = SentenceTransformersDocumentEmbedder(model="model")
 
@@ -314,7 +698,26 @@ class TestSentenceTransformersDocumentEmbedder:
             show_progress_bar=True,
             normalize_embeddings=False,
             precision="float32",
+            sort_by_length=False,
+            overlap_tokenization=False,
+            max_tokens_per_batch=None,
+            truncate_dim=None,
+            convert_to_numpy=True,
+        )
+
+    def test_prepare_texts_to_embed(self):
+        embedder = SentenceTransformersDocumentEmbedder(
+            model="model", prefix="p ", suffix=" s", meta_fields_to_embed=["a", "b"], embedding_separator=" | "
         )
+        documents = [
+            Document(content="text", meta={"a": "x", "b": 1}),
+            Document(content="text", meta={"b": 0, "c": "ignored"}),
+            Document(content=None, meta={"a": "x"}),
+        ]
+        assert embedder._prepare_texts_to_embed(documents) == ["p x | 1 | text s", "p text s", "p x |  s"]
+
+        embedder.meta_fields_to_embed = []
+        assert embedder._prepare_texts_to_embed(documents) == ["p text s", "p text s", "p  s"]
 
     def test_prefix_suffix(self):
         embedder = SentenceTransformersDocumentEmbedder(
@@ -339,4 +742,9 @@ class TestSentenceTransformersDocumentEmbedder:
             show_progress_bar=True,
             normalize_embeddings=False,
             precision="float32",
+            sort_by_length=False,
+            overlap_tokenization=False,
+            max_tokens_per_batch=None,
+            truncate_dim=None,
+            convert_to_numpy=True,
         )
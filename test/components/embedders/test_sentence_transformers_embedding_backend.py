@@ -1,18 +1,24 @@
 # SPDX-FileCopyrightText: 2022-present deepset GmbH <info@deepset.ai>
 #
 # SPDX-License-Identifier: Apache-2.0
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
+import numpy as np
 import pytest
+import torch
 
+from haystack.components.embedders import SentenceTransformersDocumentEmbedder, SentenceTransformersTextEmbedder
 from haystack.components.embedders.backends.sentence_transformers_backend import (
+    _SentenceTransformersEmbeddingBackend,
     _SentenceTransformersEmbeddingBackendFactory,
 )
+from haystack.utils import ComponentDevice
 from haystack.utils.auth import Secret
 
 
 @patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
 def test_factory_behavior(mock_sentence_transformer):
+    mock_sentence_transformer.return_value.__getitem__.return_value.auto_model = torch.nn.Identity()
     embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(
         model="my_model", device="cpu"
     )
@@ -24,6 +30,34 @@ def test_factory_behavior(mock_sentence_transformer):
     assert same_embedding_backend is embedding_backend
     assert another_embedding_backend is not embedding_backend
 
+    half_precision_embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(
+        model="my_model", device="cpu", model_kwargs={"torch_dtype": "float16"}
+    )
+    assert half_precision_embedding_backend is not embedding_backend
+
+    onnx_embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(
+        model="my_model", device="cpu", backend="onnx"
+    )
+    assert onnx_embedding_backend is not embedding_backend
+
+    compiled_embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(
+        model="my_model", device="cpu", compile_model=True
+    )
+    assert compiled_embedding_backend is not embedding_backend
+    assert compiled_embedding_backend.compiled is True
+    assert embedding_backend.compiled is False
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_text_and_document_embedders_share_backend_on_cuda(mock_sentence_transformer):
+    device = ComponentDevice.from_str("cuda:0")
+    document_embedder = SentenceTransformersDocumentEmbedder(model="shared_cuda_model", device=device)
+    text_embedder = SentenceTransformersTextEmbedder(model="shared_cuda_model", device=device)
+    document_embedder.warm_up()
+    text_embedder.warm_up()
+
+    assert text_embedder.embedding_backend is document_embedder.embedding_backend
+
 
 @patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
 def test_model_initialization(mock_sentence_transformer):
@@ -46,6 +80,40 @@ def test_model_initialization(mock_sentence_transformer):
     )
 
 
+@patch("sentence_transformers.export_dynamic_quantized_onnx_model")
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_onnx_model_is_quantized_once(mock_sentence_transformer, mock_export, tmp_path):
+    model_kwargs = {"file_name": "onnx/model_qint8_avx512_vnni.onnx", "provider": "CPUExecutionProvider"}
+    _SentenceTransformersEmbeddingBackend(model=str(tmp_path), device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    assert mock_sentence_transformer.call_count == 2
+    assert mock_sentence_transformer.call_args_list[0].kwargs["model_kwargs"] == {"provider": "CPUExecutionProvider"}
+    assert mock_sentence_transformer.call_args_list[1].kwargs["model_kwargs"] == model_kwargs
+    mock_export.assert_called_once_with(
+        mock_sentence_transformer.return_value, quantization_config="avx512_vnni", model_name_or_path=str(tmp_path)
+    )
+
+    mock_sentence_transformer.reset_mock()
+    mock_export.reset_mock()
+    (tmp_path / "onnx").mkdir()
+    (tmp_path / "onnx" / "model_qint8_avx512_vnni.onnx").touch()
+    _SentenceTransformersEmbeddingBackend(model=str(tmp_path), device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    mock_sentence_transformer.assert_called_once()
+    mock_export.assert_not_called()
+
+
+@patch("sentence_transformers.export_dynamic_quantized_onnx_model")
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_onnx_model_from_hub_is_not_quantized(mock_sentence_transformer, mock_export):
+    _SentenceTransformersEmbeddingBackend(
+        model="org/model", backend="onnx", model_kwargs={"file_name": "onnx/model_qint8_avx2.onnx"}
+    )
+
+    mock_sentence_transformer.assert_called_once()
+    mock_export.assert_not_called()
+
+
 @patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
 def test_embedding_function_with_kwargs(mock_sentence_transformer):
     embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="model")
@@ -54,3 +122,385 @@ def test_embedding_function_with_kwargs(mock_sentence_transformer):
     embedding_backend.embed(data=data, normalize_embeddings=True)
 
     embedding_backend.model.encode.assert_called_once_with(data, normalize_embeddings=True)
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_convert_to_numpy(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="numpy_model")
+    embedding_backend.model.encode.return_value = np.array([[1.0, 2.0], [3.0, 4.0]])
+
+    embeddings = embedding_backend.embed(data=["sentence1", "sentence2"], convert_to_numpy=True)
+
+    assert isinstance(embeddings, np.ndarray)
+    assert embeddings.tolist() == [[1.0, 2.0], [3.0, 4.0]]
+    embedding_backend.model.encode.assert_called_once_with(["sentence1", "sentence2"])
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_token_lengths(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="token_lengths_model")
+    embedding_backend.model.max_seq_length = 128
+    embedding_backend.model.tokenizer.return_value = {"input_ids": [[1, 2], [1]], "length": [2, 1]}
+
+    assert embedding_backend.token_lengths(["sentence one", "one"]) == [2, 1]
+    embedding_backend.model.tokenizer.assert_called_once_with(
+        ["sentence one", "one"], truncation=True, max_length=128, return_length=True
+    )
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_sorted_by_length(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="sorted_model")
+    embedding_backend.model.tokenizer.return_value = {"length": [5, 1, 3, 2]}
+    embedding_backend.model.encode.side_effect = lambda texts, **kwargs: np.array(
+        [[float(len(text))] for text in texts]
+    )
+
+    data = ["ccccc", "a", "bbb", "dd"]
+    embeddings = embedding_backend.embed(data=data, sort_by_length=True, batch_size=2, normalize_embeddings=True)
+
+    assert embeddings == [[5.0], [1.0], [3.0], [2.0]]
+    batches = [call.args[0] for call in embedding_backend.model.encode.call_args_list]
+    assert batches == [["a", "dd"], ["bbb", "ccccc"]]
+    for call in embedding_backend.model.encode.call_args_list:
+        assert call.kwargs == {"batch_size": 2, "show_progress_bar": False, "normalize_embeddings": True}
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_sorted_by_length_single_batch(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="single_batch_model")
+    embedding_backend.model.encode.return_value = np.array([[1.0], [2.0]])
+
+    embeddings = embedding_backend.embed(data=["bb", "a"], sort_by_length=True, batch_size=2)
+
+    assert embeddings == [[1.0], [2.0]]
+    embedding_backend.model.tokenizer.assert_not_called()
+    embedding_backend.model.encode.assert_called_once_with(["bb", "a"], batch_size=2)
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_with_max_tokens_per_batch(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="token_batches_model")
+    lengths = {"a": 2, "bb": 2, "ccc": 3, "dddd": 6, "eeeee": 10}
+    embedding_backend.model.tokenizer.side_effect = lambda texts, **kwargs: {"length": [lengths[t] for t in texts]}
+    embedding_backend.model.encode.side_effect = lambda texts, **kwargs: np.array([[float(len(t))] for t in texts])
+
+    data = ["eeeee", "ccc", "a", "dddd", "bb"]
+    embeddings = embedding_backend.embed(data=data, sort_by_length=True, max_tokens_per_batch=8)
+
+    assert embeddings == [[5.0], [3.0], [1.0], [4.0], [2.0]]
+    batches = [call.args[0] for call in embedding_backend.model.encode.call_args_list]
+    assert batches == [["a", "bb"], ["ccc"], ["dddd"], ["eeeee"]]
+    assert [call.kwargs["batch_size"] for call in embedding_backend.model.encode.call_args_list] == [2, 1, 1, 1]
+
+
+def test_pack_batches():
+    order = np.array([0, 1, 2, 3, 4])
+    batches = _SentenceTransformersEmbeddingBackend._pack_batches(order, [1, 1, 2, 2, 9], max_tokens_per_batch=6)
+    assert [batch.tolist() for batch in batches] == [[0, 1, 2], [3], [4]]
+
+    batches = _SentenceTransformersEmbeddingBackend._pack_batches(order, [1, 1, 1, 1, 1], max_tokens_per_batch=100)
+    assert [batch.tolist() for batch in batches] == [[0, 1, 2, 3, 4]]
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.quantize_embeddings")
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_sorted_by_length_quantizes_all_embeddings_at_once(
+    mock_sentence_transformer, mock_quantize_embeddings
+):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="quantized_model")
+    embedding_backend.model.tokenizer.return_value = {"length": [2, 1]}
+    embedding_backend.model.encode.side_effect = lambda texts, **kwargs: np.array([[1.0, 2.0] for _ in texts])
+    mock_quantize_embeddings.side_effect = lambda embeddings, precision: embeddings.astype(np.int8)
+
+    embeddings = embedding_backend.embed(data=["aa", "b"], sort_by_length=True, batch_size=1, precision="int8")
+
+    assert embeddings == [[1, 2], [1, 2]]
+    mock_quantize_embeddings.assert_called_once()
+    assert mock_quantize_embeddings.call_args.args[0].tolist() == [[1.0, 2.0], [1.0, 2.0]]
+    assert mock_quantize_embeddings.call_args.kwargs == {"precision": "int8"}
+    for call in embedding_backend.model.encode.call_args_list:
+        assert "precision" not in call.kwargs
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_with_truncate_dim(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="truncated_model")
+    embedding_backend.model.encode.return_value = np.array([[3.0, 4.0, 12.0], [1.0, 0.0, 5.0]])
+
+    embeddings = embedding_backend.embed(data=["sentence1", "sentence2"], truncate_dim=2)
+    assert embeddings == [[3.0, 4.0], [1.0, 0.0]]
+
+    embeddings = embedding_backend.embed(data=["sentence1", "sentence2"], truncate_dim=2, normalize_embeddings=True)
+    assert np.allclose(embeddings, [[0.6, 0.8], [1.0, 0.0]])
+    embedding_backend.model.encode.assert_called_with(["sentence1", "sentence2"], normalize_embeddings=False)
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.quantize_embeddings")
+def test_quantize(mock_quantize_embeddings):
+    embeddings = np.array([[1.0, -1.0]])
+    _SentenceTransformersEmbeddingBackend.quantize(embeddings, precision="binary")
+    mock_quantize_embeddings.assert_called_once_with(embeddings, precision="binary")
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.quantize_embeddings")
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_quantizes_after_truncation(mock_sentence_transformer, mock_quantize_embeddings):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(
+        model="truncated_quantized_model"
+    )
+    embedding_backend.model.encode.return_value = np.array([[1.0, -1.0, 1.0, 1.0]])
+    mock_quantize_embeddings.side_effect = lambda embeddings, precision: (embeddings > 0).astype(np.uint8)
+
+    embeddings = embedding_backend.embed(data=["sentence1"], truncate_dim=2, precision="ubinary")
+
+    assert embeddings == [[1, 0]]
+    embedding_backend.model.encode.assert_called_once_with(["sentence1"])
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_with_overlapping_tokenization(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="overlapping_model")
+    embedding_backend.model.device = torch.device("cpu")
+    embedding_backend.model.default_prompt_name = None
+    embedding_backend.model.tokenize.side_effect = lambda texts: {
+        "input_ids": torch.tensor([[len(text)] for text in texts]),
+        "modality": "text",
+    }
+    embedding_backend.model.forward.side_effect = lambda features: {
+        "sentence_embedding": features["input_ids"].float().repeat(1, 2)
+    }
+
+    data = ["aaa", "b", "cc", "dddd", "eeeee"]
+    embeddings = embedding_backend.embed(data=data, overlap_tokenization=True, batch_size=2)
+
+    assert embeddings == [[3.0, 3.0], [1.0, 1.0], [2.0, 2.0], [4.0, 4.0], [5.0, 5.0]]
+    assert embedding_backend.model.tokenize.call_count == 3
+    embedding_backend.model.encode.assert_not_called()
+
+    embeddings = embedding_backend.embed(data=data, overlap_tokenization=True, batch_size=2, normalize_embeddings=True)
+    assert np.allclose(embeddings, [[2**-0.5, 2**-0.5]] * 5)
+
+
+@patch("torch.cuda.current_stream")
+@patch("torch.cuda.Event")
+@patch("torch.cuda.stream")
+@patch("torch.cuda.Stream")
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_with_overlapping_tokenization_copies_on_separate_cuda_stream(
+    mock_sentence_transformer, mock_stream, mock_stream_context, mock_event, mock_current_stream
+):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="cuda_streams_model")
+    embedding_backend.model.device = torch.device("cuda:0")
+    embedding_backend.model.default_prompt_name = None
+    input_ids = MagicMock(spec=torch.Tensor)
+    copied_input_ids = MagicMock(spec=torch.Tensor)
+    input_ids.pin_memory.return_value.to.return_value = copied_input_ids
+    embedding_backend.model.tokenize.side_effect = lambda texts: {"input_ids": input_ids, "modality": "text"}
+    calls = MagicMock()
+    calls.attach_mock(mock_stream_context, "stream")
+    calls.attach_mock(input_ids.pin_memory.return_value.to, "copy")
+    calls.attach_mock(mock_current_stream.return_value.wait_event, "wait_event")
+    calls.attach_mock(embedding_backend.model.forward, "forward")
+    embedding_backend.model.forward.return_value = {"sentence_embedding": torch.tensor([[1.0, 0.0]])}
+
+    embedding_backend.embed(data=["a", "b"], overlap_tokenization=True, batch_size=1)
+
+    copy_stream = mock_stream.return_value
+    mock_stream_context.assert_called_with(copy_stream)
+    input_ids.pin_memory.return_value.to.assert_called_with(torch.device("cuda:0"), non_blocking=True)
+    mock_event.return_value.record.assert_called_with(copy_stream)
+    mock_current_stream.return_value.wait_event.assert_called_with(mock_event.return_value)
+    copied_input_ids.record_stream.assert_called_with(mock_current_stream.return_value)
+    # Each batch is copied on the copy stream, and the model waits for the copy before using the batch
+    call_names = [name for name, _, _ in calls.mock_calls if name in ("stream", "copy", "wait_event", "forward")]
+    assert call_names.index("wait_event") < call_names.index("forward")
+    assert call_names.count("copy") == 2
+    assert call_names.count("forward") == 2
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_with_overlapping_tokenization_applies_default_prompt(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="prompted_model")
+    embedding_backend.model.device = torch.device("cpu")
+    embedding_backend.model.prompts = {"query": "query: "}
+    embedding_backend.model.default_prompt_name = "query"
+    embedding_backend.model.preprocess.return_value = {"input_ids": torch.tensor([[1, 2, 3], [1, 2, 3]])}
+    embedding_backend.model.forward.return_value = {"sentence_embedding": torch.tensor([[1.0, 0.0], [1.0, 0.0]])}
+
+    embeddings = embedding_backend.embed(data=["text", "text"], overlap_tokenization=True)
+
+    assert embeddings == [[1.0, 0.0], [1.0, 0.0]]
+    embedding_backend.model.preprocess.assert_called_once_with(["text", "text"], prompt="query: ")
+    embedding_backend.model.tokenize.assert_not_called()
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_with_overlapping_tokenization_applies_default_prompt_without_preprocess(
+    mock_sentence_transformer,
+):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="old_prompted_model")
+    # Sentence Transformers versions before 5 have no `preprocess` method
+    del embedding_backend.model.preprocess
+    embedding_backend.model.device = torch.device("cpu")
+    embedding_backend.model.prompts = {"query": "query: "}
+    embedding_backend.model.default_prompt_name = "query"
+    embedding_backend.model.tokenize.side_effect = lambda texts: {
+        "input_ids": torch.ones((len(texts), 3 if texts == ["query: "] else 5), dtype=torch.long)
+    }
+    embedding_backend.model.forward.return_value = {"sentence_embedding": torch.tensor([[1.0, 0.0], [1.0, 0.0]])}
+
+    embedding_backend.embed(data=["text", "text"], overlap_tokenization=True)
+
+    assert embedding_backend.model.tokenize.call_args_list[0].args == (["query: text", "query: text"],)
+    features = embedding_backend.model.forward.call_args.args[0]
+    assert features["prompt_length"] == 2
+
+
+@pytest.mark.integration
+def test_embedding_function_with_overlapping_tokenization_matches_encode_with_prompt():
+    embedding_backend = _SentenceTransformersEmbeddingBackend(
+        model="sentence-transformers/paraphrase-albert-small-v2", device="cpu"
+    )
+    embedding_backend.model.prompts = {"query": "query: "}
+    embedding_backend.model.default_prompt_name = "query"
+    # Without the prompt tokens in the mean, the embeddings depend on the prompt length too
+    embedding_backend.model[1].include_prompt = False
+    data = ["a nice text to embed", "a much longer text to embed, with a few more words in it", "short"]
+
+    expected = embedding_backend.model.encode(data, batch_size=2)
+    embeddings = embedding_backend.embed(data=data, overlap_tokenization=True, batch_size=2, convert_to_numpy=True)
+
+    assert np.allclose(embeddings, expected, atol=1e-5)
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_compile(mock_sentence_transformer):
+    torch._dynamo.reset()
+    torch._dynamo.utils.counters.clear()
+    auto_model = torch.nn.Linear(4, 2)
+    mock_sentence_transformer.return_value.__getitem__.return_value.auto_model = auto_model
+
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(
+        model="compiled_model", compile_model=True
+    )
+    # Sentence Transformers 5 calls `forward` directly, while earlier versions call the module
+    auto_model.forward(torch.ones(2, 4))
+    auto_model(torch.ones(2, 4))
+
+    assert embedding_backend.compiled is True
+    assert torch._dynamo.utils.counters["stats"]["unique_graphs"] == 1
+    torch._dynamo.reset()
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_compiled_pads_to_buckets(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="bucketed_model")
+    embedding_backend.compiled = True
+    embedding_backend.model.device = torch.device("cpu")
+    embedding_backend.model.default_prompt_name = None
+    embedding_backend.model.max_seq_length = 512
+    embedding_backend.model.tokenizer.padding_side = "right"
+    embedding_backend.model.tokenizer.pad_token_id = 0
+    embedding_backend.model.tokenize.side_effect = lambda texts: {
+        "input_ids": torch.ones((len(texts), max(len(text) for text in texts)), dtype=torch.long),
+        "attention_mask": torch.ones((len(texts), max(len(text) for text in texts)), dtype=torch.long),
+    }
+    embedding_backend.model.forward.side_effect = lambda features: {
+        "sentence_embedding": torch.stack(
+            [
+                features["attention_mask"].sum(dim=1),
+                torch.full((len(features["input_ids"]),), features["input_ids"].shape[1]),
+            ],
+            dim=1,
+        ).float()
+    }
+
+    embeddings = embedding_backend.embed(data=["a" * 10, "b" * 100, "c" * 600], batch_size=1)
+
+    # The attention mask still covers the original tokens only, while batches are padded to the buckets
+    assert embeddings == [[10.0, 64.0], [100.0, 128.0], [600.0, 600.0]]
+    embedding_backend.model.encode.assert_not_called()
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_compiled_pads_to_batch_size(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="batch_padded_model")
+    embedding_backend.compiled = True
+    embedding_backend.model.device = torch.device("cpu")
+    embedding_backend.model.default_prompt_name = None
+    embedding_backend.model.max_seq_length = 512
+    embedding_backend.model.tokenizer.padding_side = "right"
+    embedding_backend.model.tokenizer.pad_token_id = 0
+    embedding_backend.model.tokenize.side_effect = lambda texts: {
+        "input_ids": torch.tensor([[len(text)] for text in texts]),
+        "attention_mask": torch.ones((len(texts), 1), dtype=torch.long),
+    }
+    embedding_backend.model.forward.side_effect = lambda features: {
+        "sentence_embedding": features["input_ids"][:, :1].float()
+    }
+
+    embeddings = embedding_backend.embed(data=["a", "bb", "ccc", "dddd", "eeeee"], batch_size=4)
+
+    # The last batch is padded with copies of its first text, whose embeddings are dropped
+    assert embeddings == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    batch_shapes = [call.args[0]["input_ids"].shape for call in embedding_backend.model.forward.call_args_list]
+    assert batch_shapes == [(4, 64), (4, 64)]
+    assert embedding_backend.model.forward.call_args.args[0]["input_ids"][:, 0].tolist() == [5, 5, 5, 5]
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_compiled_applies_default_prompt(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(
+        model="compiled_prompt_model"
+    )
+    embedding_backend.compiled = True
+    embedding_backend.model.device = torch.device("cpu")
+    embedding_backend.model.max_seq_length = 64
+    embedding_backend.model.tokenizer.padding_side = "right"
+    embedding_backend.model.tokenizer.pad_token_id = 0
+    embedding_backend.model.prompts = {"query": "query: "}
+    embedding_backend.model.default_prompt_name = "query"
+    embedding_backend.model.preprocess.return_value = {"input_ids": torch.ones((1, 3), dtype=torch.long)}
+    embedding_backend.model.forward.return_value = {"sentence_embedding": torch.tensor([[1.0, 0.0]])}
+
+    embeddings = embedding_backend.embed(data=["text"])
+
+    assert embeddings == [[1.0, 0.0]]
+    embedding_backend.model.preprocess.assert_called_once_with(["text"], prompt="query: ")
+    embedding_backend.model.tokenize.assert_not_called()
+    assert embedding_backend.model.forward.call_args.args[0]["input_ids"].shape == (32, 64)
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_embedding_function_compiled_with_empty_input(mock_sentence_transformer):
+    mock_sentence_transformer.return_value.__getitem__.return_value.auto_model = torch.nn.Identity()
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(
+        model="compiled_empty_model", compile_model=True
+    )
+
+    assert embedding_backend.embed(data=[]) == []
+    assert embedding_backend.embed(data=[], convert_to_numpy=True).shape == (0, 0)
+    embedding_backend.model.tokenizer.assert_not_called()
+    embedding_backend.model.tokenize.assert_not_called()
+    embedding_backend.model.forward.assert_not_called()
+
+
+@patch("haystack.components.embedders.backends.sentence_transformers_backend.SentenceTransformer")
+def test_pad_to_bucket(mock_sentence_transformer):
+    embedding_backend = _SentenceTransformersEmbeddingBackendFactory.get_embedding_backend(model="padded_model")
+    embedding_backend.model.max_seq_length = 200
+    embedding_backend.model.tokenizer.padding_side = "left"
+    embedding_backend.model.tokenizer.pad_token_id = 7
+    features = {
+        "input_ids": torch.ones((2, 130), dtype=torch.long),
+        "attention_mask": torch.ones((2, 130), dtype=torch.long),
+        "modality": "text",
+    }
+
+    embedding_backend._pad_to_bucket(features)
+
+    assert features["input_ids"].shape == (2, 200)
+    assert features["input_ids"][:, :70].eq(7).all() and features["input_ids"][:, 70:].eq(1).all()
+    assert features["attention_mask"][:, :70].eq(0).all() and features["attention_mask"][:, 70:].eq(1).all()
+    assert features["modality"] == "text"
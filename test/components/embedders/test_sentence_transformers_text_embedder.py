@@ -226,6 +226,21 @@ class TestSentenceTransformersTextEmbedder:
             config_kwargs=None,
         )
 
+    @patch(
+        "haystack.components.embedders.sentence_transformers_text_embedder._SentenceTransformersEmbeddingBackendFactory"
+    )
+    def test_warmup_uses_half_precision_on_cuda(self, mocked_factory):
+        embedder = SentenceTransformersTextEmbedder(model="model", device=ComponentDevice.from_str("cuda:0"))
+        embedder.warm_up()
+        assert mocked_factory.get_embedding_backend.call_args.kwargs["model_kwargs"] == {"torch_dtype": "float16"}
+        assert embedder.model_kwargs is None
+
+        embedder = SentenceTransformersTextEmbedder(
+            model="model", device=ComponentDevice.from_str("cuda:0"), model_kwargs={"torch_dtype": "float32"}
+        )
+        embedder.warm_up()
+        assert mocked_factory.get_embedding_backend.call_args.kwargs["model_kwargs"] == {"torch_dtype": "float32"}
+
     @patch(
         "haystack.components.embedders.sentence_transformers_text_embedder._SentenceTransformersEmbeddingBackendFactory"
     )